@@ -10,26 +10,64 @@ Features:
 - Integration with existing QR scanning system
 """
 
+import gc
+import os
+import threading
 import time
 import math
-from enum import Enum
-from typing import List, Tuple, Optional
+from collections import deque
+from enum import Enum, IntEnum
+from typing import Tuple, Optional
 import states
 from picar import Picar
 
 
-class CurveFollowerState(Enum):
-    """States for the curve following state machine"""
-    INIT = "initialization"
-    WAITING_START = "waiting_for_start"
-    LINE_FOLLOWING = "line_following"
-    CURVE_DETECTION = "curve_detection"
-    CURVE_FOLLOWING = "curve_following"
-    DOT_DETECTION = "dot_detection"
-    CROSSING_ANALYSIS = "crossing_analysis"
-    QR_SCANNING = "qr_scanning"
-    GOAL_REACHED = "goal_reached"
-    ERROR_RECOVERY = "error_recovery"
+# Sensor readings are a 5-bit mask: bit i set = sensor i (0 = far left) on the line
+ALL_SENSORS = 0x1F
+CENTER_SENSOR = 0x04
+
+# Number of active sensors for each of the 32 possible masks
+_POPCOUNT = bytes(bin(i).count('1') for i in range(32))
+
+# PID math runs in Q16.16 fixed point, floats only appear at the motor output
+PID_SCALE_BITS = 16
+PID_SCALE = 1 << PID_SCALE_BITS
+
+
+def _q16_to_q8(speed: int) -> int:
+    """Convert a Q16.16 speed to the 0..255 levels of set_speeds_q, same scale as _to_q8"""
+    level = (speed * 255 + (PID_SCALE >> 1)) >> PID_SCALE_BITS  # Rounded like _to_q8
+    return 0 if level < 0 else 255 if level > 255 else level
+
+# Handlers return the next state and an optional (left, right) motor command
+# in set_speeds_q levels; update() performs the single motor write per tick
+MotorCommand = Optional[Tuple[int, int]]
+_STOP = (0, 0)
+
+
+def _to_q8(speed: float) -> int:
+    """Convert a 0..1 speed to the 0..255 levels of set_speeds_q"""
+    return round(max(min(1.0, speed), 0.0) * 255)
+
+
+# Line search speeds used by error recovery
+_RECOVERY_LEFT = (_to_q8(0.1), _to_q8(0.2))
+_RECOVERY_RIGHT = (_to_q8(0.2), _to_q8(0.1))
+_RECOVERY_FORWARD = (_to_q8(0.15), _to_q8(0.15))
+
+
+class CurveFollowerState(IntEnum):
+    """States for the curve following state machine (int valued for cheap compares)"""
+    INIT = 0
+    WAITING_START = 1
+    LINE_FOLLOWING = 2
+    CURVE_DETECTION = 3
+    CURVE_FOLLOWING = 4
+    DOT_DETECTION = 5
+    CROSSING_ANALYSIS = 6
+    QR_SCANNING = 7
+    GOAL_REACHED = 8
+    ERROR_RECOVERY = 9
 
 
 class CurveType(Enum):
@@ -41,6 +79,98 @@ class CurveType(Enum):
     SHARP_RIGHT = "sharp_right"
 
 
+def _classify_curve(sensors: int) -> CurveType:
+    """Curve type for a sensor mask, used to fill the lookup table"""
+    left_sensors = _POPCOUNT[sensors & 0x03]
+    center_sensor = sensors & CENTER_SENSOR
+    right_sensors = _POPCOUNT[sensors & 0x18]
+
+    if center_sensor and left_sensors == 0 and right_sensors == 0:
+        return CurveType.STRAIGHT
+    elif left_sensors >= 2:
+        return CurveType.SHARP_LEFT if left_sensors == 2 else CurveType.GENTLE_LEFT
+    elif right_sensors >= 2:
+        return CurveType.SHARP_RIGHT if right_sensors == 2 else CurveType.GENTLE_RIGHT
+    elif left_sensors == 1 and center_sensor:
+        return CurveType.GENTLE_LEFT
+    elif right_sensors == 1 and center_sensor:
+        return CurveType.GENTLE_RIGHT
+
+    return CurveType.STRAIGHT
+
+
+def _line_position(sensors: int) -> float:
+    """Mean weight of the active sensors, used to fill the lookup table"""
+    weights = [-2.0, -1.0, 0.0, 1.0, 2.0]
+    active = [weights[i] for i in range(5) if sensors & (1 << i)]
+    if active:
+        return sum(active) / len(active)
+    return 0.0  # No line detected
+
+
+def _build_decision_tables():
+    """
+    Evaluate the per-reading predicates once for all 32 sensor masks so the
+    state handlers only need a single index per lookup. Line positions are
+    stored in Q16.16 fixed point.
+    """
+    curve_types = []
+    line_positions = []
+    crossings = []
+    for mask in range(32):
+        curve_types.append(_classify_curve(mask))
+        line_positions.append(int(round(_line_position(mask) * PID_SCALE)))
+        crossings.append(_POPCOUNT[mask] >= 4)  # Most sensors active = crossing
+    return tuple(curve_types), tuple(line_positions), tuple(crossings)
+
+
+_CURVE_TYPES, _LINE_POSITIONS, _CROSSINGS = _build_decision_tables()
+
+
+def _build_dot_dfa():
+    """
+    DFA over sensor masks for dot detection. A state (5 bits) holds how many
+    readings were seen (capped at 3) and the center sensor of the last three,
+    so "two center transitions in a row" is a property of the state itself.
+    Transitions are indexed by (state << 5) | mask.
+    """
+    transitions = bytearray(32 * 32)
+    accepting = []
+    for state in range(32):
+        seen, centers = state >> 3, state & 0b111
+        for mask in range(32):
+            center = 1 if mask & CENTER_SENSOR else 0
+            transitions[(state << 5) | mask] = (min(seen + 1, 3) << 3) | ((centers << 1) & 0b111) | center
+        accepting.append(seen == 3 and centers in (0b010, 0b101))
+    return bytes(transitions), tuple(accepting)
+
+
+_DOT_TRANSITIONS, _DOT_ACCEPTING = _build_dot_dfa()
+
+
+def _pid_step(error: int, integral: int, previous_error: int,
+              gains: Tuple[int, int, int, int, int]) -> Tuple[int, int, int]:
+    """
+    One Q16.16 PID step, free of object state and I/O
+    gains: (kp, ki * dt, kd / dt, base_speed, max_adjustment)
+    Returns: (left_speed, right_speed, integral) in Q16.16
+    """
+    kp, ki, kd, base_speed, max_adjustment = gains
+    
+    # PID calculations (integral is the sum of errors, dt is folded into ki)
+    integral += error
+    pid_output = (kp * error + ki * integral + kd * (error - previous_error)) >> PID_SCALE_BITS
+    
+    # Limit PID output
+    if pid_output > max_adjustment:
+        pid_output = max_adjustment
+    elif pid_output < -max_adjustment:
+        pid_output = -max_adjustment
+    
+    # Base speed +/- 80% stays within 0..1 for base speeds up to 0.55
+    return base_speed - pid_output, base_speed + pid_output, integral
+
+
 class CurveFollower:
     """
     Professional curve following implementation with state machine logic
@@ -55,12 +185,18 @@ class CurveFollower:
         self.motor_left = self.pc.MOTOR_LEFT
         self.motor_right = self.pc.MOTOR_RIGHT
         
+        # Bound per-tick calls, skips the attribute and method lookups
+        self._read_sensors = self.pc.get_line_sensor_states
+        self._move_motors = self.pc.set_speeds
+        self._move_motors_q = self.pc.set_speeds_q
+        self._now = time.monotonic_ns  # Integer ns, unaffected by clock changes
+        
         # PID Controller parameters for smooth following
         self.pid_kp = 0.8  # Proportional gain
         self.pid_ki = 0.1  # Integral gain
         self.pid_kd = 0.3  # Derivative gain
-        self.pid_integral = 0.0
-        self.pid_previous_error = 0.0
+        self.pid_integral = 0  # Q16.16, sum of errors
+        self.pid_previous_error = 0  # Q16.16
         
         # Speed configurations for different scenarios
         self.speeds = {
@@ -72,19 +208,61 @@ class CurveFollower:
         }
         
         # Sensor thresholds and patterns
-        self.sensor_history = []
-        self.history_length = 5
+        self._dot_state = 0  # Dot detection DFA state, see _build_dot_dfa
         self.dot_detection_threshold = 3  # Number of consecutive dot patterns
         self.curve_detection_threshold = 2
         
         # State timing
         self.update_interval = 0.05  # 20Hz update rate
-        self.state_entry_time = time.time()
+        # False while update() runs for a sensor edge between the fixed-rate
+        # ticks; the PID and the tick counters only advance on the fixed rate
+        self._on_cadence = True
+        
+        # Real-time settings for the control loop in run()
+        self.control_cpu = 3
+        self.control_priority = 80  # SCHED_FIFO priority
+        
+        # Messages from the control loop are printed by a background thread,
+        # started here so it keeps the normal (lower) scheduling priority
+        self._log_queue = deque(maxlen=1024)
+        self.log = self._log_queue.append
+        self._last_message = None
+        threading.Thread(target=self._log_worker, daemon=True).start()
+        self.state_entry_time = self._now()
+        
+        # Q16.16 PID terms folded with the fixed update interval, so the
+        # per-tick integral is a plain sum of errors and no division is needed
+        self._pid_gains_q = (
+            int(self.pid_kp * PID_SCALE),
+            int(self.pid_ki * self.update_interval * PID_SCALE),
+            int(self.pid_kd / self.update_interval * PID_SCALE),
+            int(self.speeds['normal'] * PID_SCALE),
+            int(self.speeds['normal'] * 0.8 * PID_SCALE),
+        )
         
         # Curve following variables
         self.current_curve_type = CurveType.STRAIGHT
         self.curve_confidence = 0
-        self.last_valid_line_time = time.time()
+        self.last_valid_line_time = self._now()
+        
+        # Mask and state of the last tick that stayed in a steady following
+        # state, used by the fast path in update()
+        self._steady_mask = -1
+        self._steady_state = None
+        self._steady_position = 0
+        
+        # State handler jump table, GOAL_REACHED has no handler and stops
+        self._dispatch = {
+            CurveFollowerState.INIT: self._handle_init,
+            CurveFollowerState.WAITING_START: self._handle_waiting_start,
+            CurveFollowerState.LINE_FOLLOWING: self._handle_line_following,
+            CurveFollowerState.CURVE_DETECTION: self._handle_curve_detection,
+            CurveFollowerState.CURVE_FOLLOWING: self._handle_curve_following,
+            CurveFollowerState.DOT_DETECTION: self._handle_dot_detection,
+            CurveFollowerState.CROSSING_ANALYSIS: self._handle_crossing_analysis,
+            CurveFollowerState.QR_SCANNING: self._handle_qr_scanning,
+            CurveFollowerState.ERROR_RECOVERY: self._handle_error_recovery,
+        }
         
         # Initialize motor directions
         self._setup_motors()
@@ -94,362 +272,377 @@ class CurveFollower:
         self.pc.set_motor_direction(self.motor_left, True)
         self.pc.set_motor_direction(self.motor_right, True)
         
-    def _get_sensor_data(self) -> List[bool]:
-        """Get current sensor readings"""
-        return self.pc.get_line_sensor_states()
-    
-    def _update_sensor_history(self, sensors: List[bool]):
-        """Maintain a history of sensor readings for pattern analysis"""
-        self.sensor_history.append(sensors.copy())
-        if len(self.sensor_history) > self.history_length:
-            self.sensor_history.pop(0)
+    def _update_sensor_history(self, sensors: int):
+        """Advance the dot detection DFA with the new reading"""
+        self._dot_state = _DOT_TRANSITIONS[(self._dot_state << 5) | sensors]
     
-    def _calculate_line_position(self, sensors: List[bool]) -> float:
-        """
-        Calculate line position relative to robot center
-        Returns: -2.0 (far left) to +2.0 (far right), 0.0 = center
-        """
-        # Weighted position calculation
-        weights = [-2.0, -1.0, 0.0, 1.0, 2.0]
-        total_weight = 0.0
-        weighted_sum = 0.0
-        
-        for i, sensor in enumerate(sensors):
-            if sensor:  # Line detected
-                weighted_sum += weights[i]
-                total_weight += 1.0
-        
-        if total_weight > 0:
-            return weighted_sum / total_weight
-        return 0.0  # No line detected
-    
-    def _detect_curve_type(self, sensors: List[bool]) -> CurveType:
-        """
-        Detect the type of curve based on sensor patterns
-        """
-        # Count active sensors on each side
-        left_sensors = sum(sensors[0:2])
-        center_sensor = sensors[2]
-        right_sensors = sum(sensors[3:5])
-        
-        # Pattern analysis for curve detection
-        if center_sensor and left_sensors == 0 and right_sensors == 0:
-            return CurveType.STRAIGHT
-        elif left_sensors >= 2:
-            return CurveType.SHARP_LEFT if left_sensors == 2 else CurveType.GENTLE_LEFT
-        elif right_sensors >= 2:
-            return CurveType.SHARP_RIGHT if right_sensors == 2 else CurveType.GENTLE_RIGHT
-        elif left_sensors == 1 and center_sensor:
-            return CurveType.GENTLE_LEFT
-        elif right_sensors == 1 and center_sensor:
-            return CurveType.GENTLE_RIGHT
-        
-        return CurveType.STRAIGHT
-    
-    def _is_dot_pattern(self, sensors: List[bool]) -> bool:
+    def _is_dot_pattern(self, sensors: int) -> bool:
         """
         Detect if current sensor reading indicates dots on the track
         Dots typically show as intermittent line detection
         """
-        if len(self.sensor_history) < 3:
-            return False
-            
-        # Look for alternating patterns that suggest dots
-        recent_readings = self.sensor_history[-3:]
-        center_readings = [reading[2] for reading in recent_readings]
-        
-        # Check for dot-like intermittent pattern
-        changes = sum(1 for i in range(1, len(center_readings)) 
-                     if center_readings[i] != center_readings[i-1])
-        
-        return changes >= 2  # Multiple transitions suggest dots
-    
-    def _is_crossing(self, sensors: List[bool]) -> bool:
-        """Detect crossing or intersection"""
-        active_sensors = sum(sensors)
-        return active_sensors >= 4  # Most sensors active = crossing
-    
-    def _is_all_white(self, sensors: List[bool]) -> bool:
-        """Detect all white (no line)"""
-        return not any(sensors)
-    
-    def _is_all_black(self, sensors: List[bool]) -> bool:
-        """Detect all black (full line)"""
-        return all(sensors)
+        # Two center sensor transitions in a row suggest dots
+        return _DOT_ACCEPTING[self._dot_state]
     
-    def _pid_control(self, line_position: float) -> Tuple[float, float]:
+    def _pid_control(self, line_position: int) -> Tuple[int, int]:
         """
         PID controller for smooth line following
-        Returns: (left_speed_adjustment, right_speed_adjustment)
+        line_position is in Q16.16 fixed point
+        Returns: (left_speed, right_speed) as 0..255 levels for set_speeds_q,
+        or None between fixed-rate ticks since the gains assume update_interval
         """
-        error = line_position  # Target is 0.0 (center)
-        
-        # PID calculations
-        self.pid_integral += error * self.update_interval
-        derivative = (error - self.pid_previous_error) / self.update_interval
-        
-        # Calculate PID output
-        pid_output = (self.pid_kp * error + 
-                     self.pid_ki * self.pid_integral + 
-                     self.pid_kd * derivative)
-        
-        # Convert to motor speed adjustments
-        base_speed = self.speeds['normal']
-        max_adjustment = base_speed * 0.8
-        
-        # Limit PID output
-        pid_output = max(-max_adjustment, min(max_adjustment, pid_output))
-        
-        # Calculate individual motor speeds
-        left_speed = base_speed - pid_output
-        right_speed = base_speed + pid_output
-        
-        # Ensure speeds are within valid range
-        left_speed = max(0, min(1.0, left_speed))
-        right_speed = max(0, min(1.0, right_speed))
-        
-        self.pid_previous_error = error
-        return left_speed, right_speed
-    
-    def _move_motors(self, left_speed: float, right_speed: float):
-        """Set motor speeds"""
-        self.pc.set_speed(self.motor_left, left_speed)
-        self.pc.set_speed(self.motor_right, right_speed)
+        if not self._on_cadence:
+            return None
+        # Target is 0 (center), so the position is the error
+        left_speed, right_speed, self.pid_integral = _pid_step(
+            line_position, self.pid_integral, self.pid_previous_error, self._pid_gains_q)
+        self.pid_previous_error = line_position
+        return _q16_to_q8(left_speed), _q16_to_q8(right_speed)
     
     def _stop_motors(self):
         """Stop both motors"""
-        self.pc.set_speed(self.motor_left, 0)
-        self.pc.set_speed(self.motor_right, 0)
+        self._move_motors(0, 0)
     
-    def _curve_following_speeds(self, curve_type: CurveType) -> Tuple[float, float]:
+    def _curve_following_speeds(self, curve_type: CurveType) -> Tuple[int, int]:
         """
         Calculate motor speeds for different curve types
+        Returns: (left_speed, right_speed) as 0..255 levels for set_speeds_q
         """
         if curve_type == CurveType.GENTLE_LEFT:
             base_speed = self.speeds['curve_gentle']
-            return base_speed * 0.7, base_speed
+            return _to_q8(base_speed * 0.7), _to_q8(base_speed)
         elif curve_type == CurveType.GENTLE_RIGHT:
             base_speed = self.speeds['curve_gentle']
-            return base_speed, base_speed * 0.7
+            return _to_q8(base_speed), _to_q8(base_speed * 0.7)
         elif curve_type == CurveType.SHARP_LEFT:
             base_speed = self.speeds['curve_sharp']
-            return base_speed * 0.5, base_speed
+            return _to_q8(base_speed * 0.5), _to_q8(base_speed)
         elif curve_type == CurveType.SHARP_RIGHT:
             base_speed = self.speeds['curve_sharp']
-            return base_speed, base_speed * 0.5
+            return _to_q8(base_speed), _to_q8(base_speed * 0.5)
         else:  # STRAIGHT
-            base_speed = self.speeds['normal']
+            base_speed = _to_q8(self.speeds['normal'])
             return base_speed, base_speed
     
     def _change_state(self, new_state: CurveFollowerState):
         """Change state with logging and timing"""
         if new_state != self.current_state:
-            print(f"State: {self.current_state.value} -> {new_state.value}")
+            self.log(f"State: {self.current_state.name} -> {new_state.name}")
             self.previous_state = self.current_state
             self.current_state = new_state
-            self.state_entry_time = time.time()
+            self.state_entry_time = self._now()
+            self._steady_mask = -1
+            self._last_message = None
     
-    def _time_in_state(self) -> float:
-        """Get time spent in current state"""
-        return time.time() - self.state_entry_time
+    def _time_in_state(self) -> int:
+        """Get time spent in current state in nanoseconds"""
+        return self._now() - self.state_entry_time
     
     # State machine implementation
-    def _handle_init(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_init(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Initialize the system"""
-        print("Initializing curve follower...")
+        self.log("Initializing curve follower...")
         self.pc.set_camera_angle(0)
-        self._stop_motors()
-        return CurveFollowerState.WAITING_START
+        return CurveFollowerState.WAITING_START, _STOP
     
-    def _handle_waiting_start(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_waiting_start(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Wait for start signal"""
-        if self._is_all_black(sensors):
-            print("Waiting for start signal...")
-            return CurveFollowerState.WAITING_START
-        elif any(sensors):
-            print("Start signal detected!")
-            return CurveFollowerState.LINE_FOLLOWING
-        return CurveFollowerState.WAITING_START
+        if sensors == ALL_SENSORS:
+            self._log_changed("Waiting for start signal...")
+            return CurveFollowerState.WAITING_START, None
+        elif sensors:
+            self.log("Start signal detected!")
+            return CurveFollowerState.LINE_FOLLOWING, None
+        return CurveFollowerState.WAITING_START, None
     
-    def _handle_line_following(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_line_following(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Main line following with PID control"""
         # Check for special conditions first
-        if self._is_all_white(sensors):
-            if self._time_in_state() > 1.0:  # Lost line for too long
-                return CurveFollowerState.ERROR_RECOVERY
-            return CurveFollowerState.LINE_FOLLOWING
+        if not sensors:  # All white
+            if self._time_in_state() > 1_000_000_000:  # Lost line for 1s
+                return CurveFollowerState.ERROR_RECOVERY, None
+            return CurveFollowerState.LINE_FOLLOWING, None
         
-        if self._is_crossing(sensors):
-            return CurveFollowerState.CROSSING_ANALYSIS
+        if _CROSSINGS[sensors]:
+            return CurveFollowerState.CROSSING_ANALYSIS, None
         
         if self._is_dot_pattern(sensors):
-            return CurveFollowerState.DOT_DETECTION
+            return CurveFollowerState.DOT_DETECTION, None
         
         # Detect curve
-        curve_type = self._detect_curve_type(sensors)
+        curve_type = _CURVE_TYPES[sensors]
         if curve_type != CurveType.STRAIGHT:
             self.current_curve_type = curve_type
-            return CurveFollowerState.CURVE_DETECTION
+            return CurveFollowerState.CURVE_DETECTION, None
         
         # Normal line following with PID
-        line_position = self._calculate_line_position(sensors)
-        left_speed, right_speed = self._pid_control(line_position)
-        self._move_motors(left_speed, right_speed)
-        
-        return CurveFollowerState.LINE_FOLLOWING
+        return CurveFollowerState.LINE_FOLLOWING, self._pid_control(_LINE_POSITIONS[sensors])
     
-    def _handle_curve_detection(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_curve_detection(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Confirm curve detection before entering curve following"""
-        curve_type = self._detect_curve_type(sensors)
+        curve_type = _CURVE_TYPES[sensors]
         
         if curve_type == self.current_curve_type:
-            self.curve_confidence += 1
+            if self._on_cadence:  # Confidence counts fixed-rate ticks, not edges
+                self.curve_confidence += 1
             if self.curve_confidence >= self.curve_detection_threshold:
-                print(f"Curve confirmed: {curve_type.value}")
-                return CurveFollowerState.CURVE_FOLLOWING
+                self.log(f"Curve confirmed: {curve_type.value}")
+                return CurveFollowerState.CURVE_FOLLOWING, None
         else:
             self.curve_confidence = 0
             if curve_type == CurveType.STRAIGHT:
-                return CurveFollowerState.LINE_FOLLOWING
+                return CurveFollowerState.LINE_FOLLOWING, None
         
         # Continue with normal following while detecting
-        line_position = self._calculate_line_position(sensors)
-        left_speed, right_speed = self._pid_control(line_position)
-        self._move_motors(left_speed, right_speed)
-        
-        return CurveFollowerState.CURVE_DETECTION
+        return CurveFollowerState.CURVE_DETECTION, self._pid_control(_LINE_POSITIONS[sensors])
     
-    def _handle_curve_following(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_curve_following(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Handle curve following with adaptive speeds"""
         # Check if still in curve
-        curve_type = self._detect_curve_type(sensors)
+        curve_type = _CURVE_TYPES[sensors]
         
         if curve_type == CurveType.STRAIGHT:
-            print("Curve completed, returning to line following")
+            self.log("Curve completed, returning to line following")
             self.curve_confidence = 0
-            return CurveFollowerState.LINE_FOLLOWING
+            return CurveFollowerState.LINE_FOLLOWING, None
         
         # Check for special conditions
-        if self._is_crossing(sensors):
-            return CurveFollowerState.CROSSING_ANALYSIS
+        if _CROSSINGS[sensors]:
+            return CurveFollowerState.CROSSING_ANALYSIS, None
         
         if self._is_dot_pattern(sensors):
-            return CurveFollowerState.DOT_DETECTION
+            return CurveFollowerState.DOT_DETECTION, None
         
         # Apply curve-specific speeds
-        left_speed, right_speed = self._curve_following_speeds(self.current_curve_type)
-        self._move_motors(left_speed, right_speed)
-        
-        return CurveFollowerState.CURVE_FOLLOWING
+        return CurveFollowerState.CURVE_FOLLOWING, self._curve_following_speeds(self.current_curve_type)
     
-    def _handle_dot_detection(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_dot_detection(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Handle dot patterns on the track"""
-        print("Dot pattern detected")
+        self._log_changed("Dot pattern detected")
         
         # Slow down for careful navigation
         base_speed = self.speeds['dot_approach']
         
         # Continue following the line at reduced speed
-        if any(sensors):
-            line_position = self._calculate_line_position(sensors)
-            if abs(line_position) < 1.0:  # Still on track
-                left_speed, right_speed = self._pid_control(line_position)
-                # Scale down speeds
-                left_speed *= 0.6
-                right_speed *= 0.6
-                self._move_motors(left_speed, right_speed)
+        command = None
+        if sensors:
+            line_position = _LINE_POSITIONS[sensors]
+            if abs(line_position) < PID_SCALE:  # Still on track
+                speeds = self._pid_control(line_position)
+                if speeds is not None:
+                    # Scale down speeds to 60%
+                    command = speeds[0] * 3 // 5, speeds[1] * 3 // 5
         
         # Check if dots lead to crossing
-        if self._is_crossing(sensors):
-            return CurveFollowerState.CROSSING_ANALYSIS
+        if _CROSSINGS[sensors]:
+            return CurveFollowerState.CROSSING_ANALYSIS, command
         
         # Return to normal following after dots
-        if not self._is_dot_pattern(sensors) and self._time_in_state() > 2.0:
-            return CurveFollowerState.LINE_FOLLOWING
+        if not self._is_dot_pattern(sensors) and self._time_in_state() > 2_000_000_000:
+            return CurveFollowerState.LINE_FOLLOWING, command
         
-        return CurveFollowerState.DOT_DETECTION
+        return CurveFollowerState.DOT_DETECTION, command
     
-    def _handle_crossing_analysis(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_crossing_analysis(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Analyze crossing and prepare for QR scanning"""
-        print("Crossing detected - stopping for QR scan")
-        self._stop_motors()
+        self._log_changed("Crossing detected - stopping for QR scan")
         
         # Wait a moment for stability
-        if self._time_in_state() > 0.5:
-            return CurveFollowerState.QR_SCANNING
+        if self._time_in_state() > 500_000_000:
+            return CurveFollowerState.QR_SCANNING, _STOP
         
-        return CurveFollowerState.CROSSING_ANALYSIS
+        return CurveFollowerState.CROSSING_ANALYSIS, _STOP
     
-    def _handle_qr_scanning(self, sensors: List[bool], qr_scanner) -> CurveFollowerState:
+    def _handle_qr_scanning(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Handle QR code scanning at crossings"""
-        # This will be called from the main loop with QR scanner
-        # The main loop should handle the actual QR scanning
-        return CurveFollowerState.QR_SCANNING
+        # The main loop performs the actual QR scan and calls handle_qr_result
+        return CurveFollowerState.QR_SCANNING, None
     
-    def _handle_error_recovery(self, sensors: List[bool]) -> CurveFollowerState:
+    def _handle_error_recovery(self, sensors: int) -> Tuple[CurveFollowerState, MotorCommand]:
         """Recover when line is lost"""
-        print("Line lost - attempting recovery")
+        self._log_changed("Line lost - attempting recovery")
         
         # Try to find the line by gentle turning
         recovery_time = self._time_in_state()
         
-        if recovery_time < 1.0:
+        if recovery_time < 1_000_000_000:
             # Try turning left first
-            self._move_motors(0.1, 0.2)
-        elif recovery_time < 2.0:
+            command = _RECOVERY_LEFT
+        elif recovery_time < 2_000_000_000:
             # Try turning right
-            self._move_motors(0.2, 0.1)
+            command = _RECOVERY_RIGHT
         else:
             # Move forward slowly
-            self._move_motors(0.15, 0.15)
+            command = _RECOVERY_FORWARD
         
         # Check if line is found
-        if any(sensors):
-            print("Line recovered!")
-            return CurveFollowerState.LINE_FOLLOWING
+        if sensors:
+            self.log("Line recovered!")
+            return CurveFollowerState.LINE_FOLLOWING, command
         
         # Timeout recovery
-        if recovery_time > 5.0:
-            print("Recovery timeout - stopping")
-            return CurveFollowerState.GOAL_REACHED
+        if recovery_time > 5_000_000_000:
+            self.log("Recovery timeout - stopping")
+            return CurveFollowerState.GOAL_REACHED, command
         
-        return CurveFollowerState.ERROR_RECOVERY
+        return CurveFollowerState.ERROR_RECOVERY, command
     
-    def update(self, qr_scanner=None) -> bool:
+    def update(self, qr_scanner=None, on_cadence: bool = True) -> bool:
         """
         Main update loop for the state machine
+        on_cadence: False when called for a sensor edge between fixed-rate
+        ticks; state transitions still happen, the PID and counters wait
         Returns: True to continue, False to stop
         """
-        sensors = self._get_sensor_data()
-        self._update_sensor_history(sensors)
+        self._on_cadence = on_cadence
+        sensors = self._read_sensors()
+        if on_cadence:
+            # The dot DFA counts readings at the fixed rate, edge bursts would trip it
+            self._update_sensor_history(sensors)
+        
+        # Fast path: with the same mask in the same steady state, every
+        # predicate gives the same answer as last tick and only the PID moves
+        if sensors == self._steady_mask and self.current_state == self._steady_state:
+            if on_cadence and self._steady_state == CurveFollowerState.LINE_FOLLOWING:
+                left_speed, right_speed = self._pid_control(self._steady_position)
+                self._move_motors_q(left_speed, right_speed)
+            # Curve speeds depend only on the mask, so the motors are already set
+            return True
         
         # State machine dispatch
-        if self.current_state == CurveFollowerState.INIT:
-            next_state = self._handle_init(sensors)
-        elif self.current_state == CurveFollowerState.WAITING_START:
-            next_state = self._handle_waiting_start(sensors)
-        elif self.current_state == CurveFollowerState.LINE_FOLLOWING:
-            next_state = self._handle_line_following(sensors)
-        elif self.current_state == CurveFollowerState.CURVE_DETECTION:
-            next_state = self._handle_curve_detection(sensors)
-        elif self.current_state == CurveFollowerState.CURVE_FOLLOWING:
-            next_state = self._handle_curve_following(sensors)
-        elif self.current_state == CurveFollowerState.DOT_DETECTION:
-            next_state = self._handle_dot_detection(sensors)
-        elif self.current_state == CurveFollowerState.CROSSING_ANALYSIS:
-            next_state = self._handle_crossing_analysis(sensors)
-        elif self.current_state == CurveFollowerState.QR_SCANNING:
-            # This should be handled by the main loop
-            next_state = CurveFollowerState.QR_SCANNING
-        elif self.current_state == CurveFollowerState.ERROR_RECOVERY:
-            next_state = self._handle_error_recovery(sensors)
-        else:  # GOAL_REACHED
+        handler = self._dispatch.get(self.current_state)
+        if handler is None:  # GOAL_REACHED
             self._stop_motors()
             return False
+        next_state, command = handler(sensors)
+        
+        # One motor write per tick, whatever the handler decided
+        if command is not None:
+            self._move_motors_q(*command)
+        
+        # Line lost (all white) is timed, so it never takes the fast path. Edge
+        # ticks do not advance the dot DFA, so only fixed-rate ticks may seed it
+        if (on_cadence and next_state == self.current_state and sensors and
+                next_state in (CurveFollowerState.LINE_FOLLOWING, CurveFollowerState.CURVE_FOLLOWING)):
+            self._steady_mask = sensors
+            self._steady_state = next_state
+            self._steady_position = _LINE_POSITIONS[sensors]
+        else:
+            self._steady_mask = -1
         
         self._change_state(next_state)
         return True
     
+    def _log_worker(self):
+        """Print queued log messages off the control thread"""
+        log_queue = self._log_queue
+        while True:
+            self._drain_log(log_queue)
+            time.sleep(0.05)
+    
+    def _log_changed(self, message: str):
+        """Log a per-tick message only once until the state or message changes"""
+        if message != self._last_message:
+            self._last_message = message
+            self.log(message)
+    
+    def _flush_log(self):
+        """Print any log messages still queued"""
+        self._drain_log(self._log_queue)
+    
+    @staticmethod
+    def _drain_log(log_queue: deque):
+        """Print queued messages until empty, safe while another thread drains too"""
+        while True:
+            try:
+                message = log_queue.popleft()
+            except IndexError:
+                break
+            print(message)
+    
+    def _enter_realtime(self):
+        """Pin the calling thread to the control CPU, give it FIFO priority and pause the GC"""
+        try:
+            os.sched_setaffinity(0, {self.control_cpu})
+        except OSError as e:
+            self.log(f"Could not pin control loop to CPU {self.control_cpu}: {e}")
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.control_priority))
+        except OSError as e:
+            self.log(f"Real-time priority unavailable, using default scheduling: {e}")
+        gc.disable()
+    
+    def _leave_realtime(self, affinity):
+        """Return the calling thread to normal scheduling on the given CPUs"""
+        gc.enable()
+        try:
+            os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+            os.sched_setaffinity(0, affinity)
+        except OSError as e:
+            self.log(f"Could not restore normal scheduling: {e}")
+    
+    def run(self, qr_scanner) -> None:
+        """
+        Run the control loop until the follower stops or the goal is reached.
+        The loop runs pinned to one CPU with SCHED_FIFO priority and the
+        garbage collector paused, so ticks are not delayed by other tasks.
+        QR scans and the moves they trigger run with normal scheduling.
+        """
+        normal_affinity = os.sched_getaffinity(0)
+        self._enter_realtime()
+        
+        # Per-tick calls bound once outside the loop
+        update = self.update
+        wait_for_sensors = self.pc.wait_for_line_sensor_change
+        now = self._now
+        interval_ns = int(self.update_interval * 1_000_000_000)
+        
+        next_tick = now() + interval_ns
+        on_cadence = True
+        try:
+            while True:
+                # Update the state machine
+                if not update(qr_scanner, on_cadence):
+                    self.log("Curve follower requested stop")
+                    break
+                
+                # Handle QR scanning state specifically
+                if self.current_state == CurveFollowerState.QR_SCANNING:
+                    self.log("Performing QR scan...")
+                    
+                    # Decoding and the timed turns are no control work, keep them
+                    # from starving the kernel on the control CPU
+                    self._leave_realtime(normal_affinity)
+                    try:
+                        qr_result = qr_scanner.start_scan()
+                        self.log(f"QR Scan result: {qr_result}")
+                        
+                        if not self.handle_qr_result(qr_result):
+                            self.log("Goal reached via QR scan!")
+                            break
+                            
+                    except Exception as e:
+                        self.log(f"QR scan error: {e}")
+                        # Continue with line following if QR scan fails
+                        self._change_state(CurveFollowerState.LINE_FOLLOWING)
+                    self._enter_realtime()
+                    next_tick = now() + interval_ns
+                
+                # Sleep until the next fixed-rate tick; a sensor edge wakes the
+                # loop early for a transitions-only update
+                remaining = next_tick - now()
+                if remaining > 0 and wait_for_sensors(remaining / 1_000_000_000):
+                    on_cadence = False
+                    continue
+                on_cadence = True
+                current = now()
+                next_tick += interval_ns
+                if next_tick <= current:
+                    next_tick = current + interval_ns  # Skip missed ticks instead of bursting
+        finally:
+            self._leave_realtime(normal_affinity)
+            self._flush_log()
+    
     def handle_qr_result(self, qr_result: str) -> bool:
         """
         Handle QR scan result and determine next action
@@ -457,7 +650,7 @@ class CurveFollower:
         """
         if not qr_result or qr_result == "0":
             # No QR or invalid - continue forward
-            print("No valid QR code - continuing forward")
+            self.log("No valid QR code - continuing forward")
             self._move_motors(self.speeds['normal'], self.speeds['normal'])
             time.sleep(1.0)
             self._change_state(CurveFollowerState.LINE_FOLLOWING)
@@ -466,7 +659,7 @@ class CurveFollower:
         qr_result = qr_result.lower()
         
         if "right" in qr_result:
-            print("QR: Turn RIGHT")
+            self.log("QR: Turn RIGHT")
             # Execute right turn
             self._move_motors(self.speeds['curve_sharp'], self.speeds['curve_sharp'] * 0.3)
             time.sleep(2.0)
@@ -474,7 +667,7 @@ class CurveFollower:
             return True
             
         elif "left" in qr_result:
-            print("QR: Turn LEFT")
+            self.log("QR: Turn LEFT")
             # Execute left turn
             self._move_motors(self.speeds['curve_sharp'] * 0.3, self.speeds['curve_sharp'])
             time.sleep(2.0)
@@ -483,13 +676,14 @@ class CurveFollower:
             
         else:
             # Goal reached
-            print("QR: Goal reached!")
+            self.log("QR: Goal reached!")
             self._change_state(CurveFollowerState.GOAL_REACHED)
             return False
     
     def cleanup(self):
         """Clean up resources"""
         self._stop_motors()
+        self._flush_log()
         print("Curve follower cleanup complete")
 
 
@@ -17,46 +17,48 @@ def setup():
 
 def go_forward():
     # set motor speed
-    pc.set_speed(motor_left, speed)
-    pc.set_speed(motor_right, speed)
+    pc.set_speeds(speed, speed)
     
 def stop():
     # set motor speed
-    pc.set_speed(motor_left, 0)
-    pc.set_speed(motor_right, 0)
+    pc.set_speeds(0, 0)
 
 def turn(direction):
     if(direction == states.Dir.LEFT):
-        pc.set_speed(motor_left, turn_forward-turn_speed)
-        pc.set_speed(motor_right, turn_forward+turn_speed)
+        pc.set_speeds(turn_forward-turn_speed, turn_forward+turn_speed)
     elif(direction == states.Dir.RIGHT):
-        pc.set_speed(motor_left, turn_forward+turn_speed)
-        pc.set_speed(motor_right, turn_forward-turn_speed)
+        pc.set_speeds(turn_forward+turn_speed, turn_forward-turn_speed)
 
-def sensor_check():
-    return pc.get_line_sensor_states()
+sensor_check = pc.get_line_sensor_states
 
-def analyse_sensor(sensor_states):
+def _classify(sensor_states):
+    # sensor_states is a bitmask, bit 0 = far left sensor ... bit 4 = far right
     #STOP
-    if(sensor_states[0] == sensor_states[1] == sensor_states[2] == sensor_states[3] == sensor_states[4]==0):
+    if(sensor_states == 0b00000):
         #print(f"stop! crossing or start or goal?")
         return states.SENSORSTATE.WHITE
-    elif(sensor_states[0] == sensor_states[1] == sensor_states[2] == sensor_states[3] == sensor_states[4]==1):
+    elif(sensor_states == 0b11111):
         #print(f"no line")
         return states.SENSORSTATE.BLACK
     #LEFT
-    elif(sensor_states[0] == 1 or sensor_states[1] == 1 and sensor_states[2] == 0):
+    elif(sensor_states & 0b00001 or (sensor_states & 0b00010 and not sensor_states & 0b00100)):
         #print(f"sensor_analyse_left = 1")
         return states.SENSORSTATE.LEFT
     #FORWARD
-    elif((sensor_states[2] == 1)):
+    elif(sensor_states & 0b00100):
         #print(f"sensor_analyse_center = 1")
         return states.SENSORSTATE.FORWARD
     #RIGHT
-    elif(sensor_states[3] == 1 or sensor_states[4] == 1 and sensor_states[2] == 0):
+    elif(sensor_states & 0b01000 or (sensor_states & 0b10000 and not sensor_states & 0b00100)):
         #print(f"sensor_analyse_right = 1")
         return states.SENSORSTATE.RIGHT
 
+# Sensor state for each of the 32 possible sensor bitmasks
+_SENSOR_TBL = tuple(_classify(mask) for mask in range(32))
+
+def analyse_sensor(sensor_states):
+    return _SENSOR_TBL[sensor_states]
+
 def motor_setup(direction):
     if(direction == states.Dir.FORWARD):
         pc.set_motor_direction(motor_left, True)
@@ -74,12 +76,15 @@ def motor_setup(direction):
 
 def crossing(update_time):
     print("CROSSING?")
-    while (analyse_sensor(sensor_check()) != states.SENSORSTATE.WHITE) and (analyse_sensor(sensor_check()) != states.SENSORSTATE.FORWARD):
+    # Read and classify the sensors once per iteration
+    current_sensor_analysis = analyse_sensor(sensor_check())
+    while (current_sensor_analysis != states.SENSORSTATE.WHITE) and (current_sensor_analysis != states.SENSORSTATE.FORWARD):
         go_forward()
         time.sleep(update_time)
-        print(analyse_sensor(sensor_check()))
+        current_sensor_analysis = analyse_sensor(sensor_check())
+        print(current_sensor_analysis)
         
-    if analyse_sensor(sensor_check()) == states.SENSORSTATE.WHITE:
+    if current_sensor_analysis == states.SENSORSTATE.WHITE:
         print(f"GOAL")
         return False
     else:
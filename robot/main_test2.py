@@ -1,5 +1,5 @@
+import re
 import time
-import threading
 import states
 from picar import Picar
 from qrcamera import QRCamera
@@ -15,90 +15,79 @@ update_time = 0.01
 motor_left = pc.MOTOR_LEFT
 motor_right = pc.MOTOR_RIGHT
 sensor_states = pc.get_line_sensor_states()
-pc.set_camera_angle(0)
 
 speed = 0.25
 turn_speed = 0.15
 turn_forward = 0.1
 
-# Threading variables for sensor monitoring
-current_sensor_states = [0, 0, 0, 0, 0]
-sensor_lock = threading.Lock()
-sensor_thread_running = True
+# QR commands, matched in one pass over the scan result
+qr_command = re.compile(r'right|level 1|level 2')
+
+# Turns are held for a number of control ticks instead of sleeping,
+# so the sensors keep being read while the car turns
+turn_ticks = round(0.1 / update_time)
+hardturn_ticks = round(0.5 / update_time)
+maneuver_ticks = 0
 
 def go_forward():
     # set motor speed
-    pc.set_speed(motor_left, speed)
-    pc.set_speed(motor_right, speed)
+    pc.set_speeds(speed, speed)
     
 def stop():
     # set motor speed
-    pc.set_speed(motor_left, 0)
-    pc.set_speed(motor_right, 0)
+    pc.set_speeds(0, 0)
 
 def hardturn(direction):
+    global maneuver_ticks
     if(direction == states.Dir.LEFT):
-        pc.set_speed(motor_left, (-turn_forward-turn_speed))
-        pc.set_speed(motor_right, (turn_forward+turn_speed))
+        pc.set_speeds((-turn_forward-turn_speed), (turn_forward+turn_speed))
     elif(direction == states.Dir.RIGHT):
-        pc.set_speed(motor_left, (turn_forward+turn_speed))
-        pc.set_speed(motor_right, (-turn_forward-turn_speed))
-    time.sleep(0.5)
+        pc.set_speeds((turn_forward+turn_speed), (-turn_forward-turn_speed))
+    maneuver_ticks = hardturn_ticks
 
 def turn(direction):
+    global maneuver_ticks
     if(direction == states.Dir.LEFT):
-        pc.set_speed(motor_left, turn_forward-turn_speed)
-        pc.set_speed(motor_right, turn_forward+turn_speed)
+        pc.set_speeds(turn_forward-turn_speed, turn_forward+turn_speed)
     elif(direction == states.Dir.RIGHT):
-        pc.set_speed(motor_left, turn_forward+turn_speed)
-        pc.set_speed(motor_right, turn_forward-turn_speed)
-    time.sleep(0.1)
-
-def sensor_check():
-    return pc.get_line_sensor_states()
-
-def sensor_monitoring_thread():
-    global current_sensor_states, sensor_thread_running
-    while sensor_thread_running:
-        try:
-            new_states = pc.get_line_sensor_states()
-            with sensor_lock:
-                current_sensor_states = new_states
-            time.sleep(0.005)  # Read sensors every 5ms for responsiveness
-        except Exception as e:
-            print(f"Sensor monitoring error: {e}")
-            time.sleep(0.01)
-
-def get_threaded_sensor_states():
-    """Get the latest sensor states from the monitoring thread"""
-    with sensor_lock:
-        return current_sensor_states.copy()
+        pc.set_speeds(turn_forward+turn_speed, turn_forward-turn_speed)
+    maneuver_ticks = turn_ticks
 
-def analyse_sensor(sensor_states):
+# Sensors are read directly in the control loop, a read is a single GPIO register access
+sensor_check = pc.get_line_sensor_states
+
+def _classify(sensor_states):
+    # sensor_states is a bitmask, bit 0 = far left sensor ... bit 4 = far right
     #STOP
-    if(sensor_states[0] == sensor_states[1] == sensor_states[2] == sensor_states[3] == sensor_states[4]==0):
+    if(sensor_states == 0b00000):
         #print(f"stop! crossing or start or goal?")
         return states.SENSORSTATE.WHITE
-    elif(sensor_states[0] == sensor_states[1] == sensor_states[2] == sensor_states[3] == sensor_states[4]==1):
+    elif(sensor_states == 0b11111):
         #print(f"no line")
         return states.SENSORSTATE.BLACK
+    elif(sensor_states == 0b00001):
+        return states.SENSORSTATE.HARDLEFT
     #LEFT
-    elif(sensor_states[0] == 1 or sensor_states[1] == 1 and sensor_states[2] == 0):
+    elif(sensor_states & 0b00001 or (sensor_states & 0b00010 and not sensor_states & 0b00100)):
         #print(f"sensor_analyse_left = 1")
         return states.SENSORSTATE.LEFT
-    elif(sensor_states[0] == 1 and sensor_states[1] == sensor_states[2] == sensor_states[3] == sensor_states[4] == 0):
-        return states.SENSORSTATE.HARDLEFT
-    elif(sensor_states[4] == 1 and sensor_states[0] == sensor_states[1] == sensor_states[2] == sensor_states[3] == 0):
+    elif(sensor_states == 0b10000):
         return states.SENSORSTATE.HARDRIGHT
     #FORWARD
-    elif((sensor_states[2] == 1)):
+    elif(sensor_states & 0b00100):
         #print(f"sensor_analyse_center = 1")
         return states.SENSORSTATE.FORWARD
     #RIGHT
-    elif(sensor_states[3] == 1 or sensor_states[4] == 1 and sensor_states[2] == 0):
+    elif(sensor_states & 0b01000 or (sensor_states & 0b10000 and not sensor_states & 0b00100)):
         #print(f"sensor_analyse_right = 1")
         return states.SENSORSTATE.RIGHT
 
+# Sensor state for each of the 32 possible sensor bitmasks
+_SENSOR_TBL = tuple(_classify(mask) for mask in range(32))
+
+def analyse_sensor(sensor_states):
+    return _SENSOR_TBL[sensor_states]
+
 def motor_setup(direction):
     if(direction == states.Dir.FORWARD):
         pc.set_motor_direction(motor_left, True)
@@ -114,38 +103,37 @@ def motor_setup(direction):
         pc.set_motor_direction(motor_right, False)
 
 
-def crossing(update_time):
-    print("CROSSING?")
-    current_sensor_analysis = analyse_sensor(get_threaded_sensor_states())
-    while (current_sensor_analysis != states.SENSORSTATE.WHITE) and (current_sensor_analysis != states.SENSORSTATE.FORWARD):
-        go_forward()
-        time.sleep(update_time)
-        current_sensor_analysis = analyse_sensor(get_threaded_sensor_states())
-        print(current_sensor_analysis)
-        
+def crossing():
+    """One control tick of driving over a crossing.
+    Returns None while still on the crossing, False at the goal (all white)
+    and True once the line continues."""
+    current_sensor_analysis = analyse_sensor(sensor_check())
     if current_sensor_analysis == states.SENSORSTATE.WHITE:
         print(f"GOAL")
         return False
-    else:
+    elif current_sensor_analysis == states.SENSORSTATE.FORWARD:
         print(f"CROSSING")
         return True
+    go_forward()
+    return None
 
 motor_setup(states.Dir.FORWARD)
 
-# Start the sensor monitoring thread
-sensor_thread = threading.Thread(target=sensor_monitoring_thread, daemon=True)
-sensor_thread.start()
-print("Sensor monitoring thread started")
+# Decode QR codes while driving, a code seen before the crossing skips the servo scan.
+# The worker needs the camera at its calibrated forward position.
+qr_scanner.recenter()
+qr_scanner.start_worker()
+pending_qr = None
 
 while active:
-    line_is = analyse_sensor(get_threaded_sensor_states())
+    line_is = analyse_sensor(sensor_check())
     # Start
     print("Entered Start Position.")
     while(notReady):
         #Startline 
         if(line_is == states.SENSORSTATE.BLACK):
             print("Waiting...")
-            time.sleep(update_time)
+            pc.wait_for_line_sensor_change(update_time)
         else:  
             print("Ready. Set.") 
             if(line_is == states.SENSORSTATE.WHITE):
@@ -153,18 +141,27 @@ while active:
             else:
                 print("GO!")
                 notReady = False
-        line_is = analyse_sensor(get_threaded_sensor_states())
+        line_is = analyse_sensor(sensor_check())
     time.sleep(1)
     print("Entered Race Start.")
     # Race Start
     while(racing):
-        line_is = analyse_sensor(get_threaded_sensor_states())
+        line_is = analyse_sensor(sensor_check())
+        maneuver_ticks = 0
+        # Ticks run on fixed deadlines so the work done in a tick does not shift the next one
+        next_tick = time.monotonic()
 
         while line_is != states.SENSORSTATE.WHITE and line_is != states.SENSORSTATE.BLACK:
 
-            line_is = analyse_sensor(get_threaded_sensor_states())
+            line_is = analyse_sensor(sensor_check())
+            qr_result = qr_scanner.latest_result()
+            if qr_result:
+                pending_qr = qr_result
 
-            if(line_is == states.SENSORSTATE.LEFT):
+            if maneuver_ticks:
+                # A turn is still running
+                maneuver_ticks -= 1
+            elif(line_is == states.SENSORSTATE.LEFT):
                 turn(states.Dir.LEFT)
             elif(line_is == states.SENSORSTATE.FORWARD):
                 go_forward()
@@ -174,44 +171,58 @@ while active:
                 hardturn(states.Dir.RIGHT)
             elif(line_is == states.SENSORSTATE.HARDLEFT):
                 hardturn(states.Dir.LEFT)
-            time.sleep(update_time)
+            
+            # Sleep until the next deadline, skip missed ones instead of bursting
+            now = time.monotonic()
+            next_tick = max(next_tick + update_time, now)
+            time.sleep(next_tick - now)
 
         stop()
-        result = qr_scanner.start_scan()
+        if pending_qr:
+            result = pending_qr
+            pending_qr = None
+        else:
+            result = qr_scanner.start_scan()
+            # The QR worker needs the camera facing forward while driving
+            qr_scanner.recenter()
+        # The code stays in view while the crossing is handled, a result decoded
+        # now would be applied again at the next crossing
+        qr_scanner.pause_worker()
         print(f"Scan result: {result}")
  
 
-        result = result.lower()
-        if "right" in result:
+        match = qr_command.search(result.lower())
+        command = match.group(0) if match else None
+        if command == "right":
             print("RIGHT")
             turn(states.Dir.RIGHT)
             time.sleep(2)
 
-        elif "level 1" in result: # or result == "level 2 left":
+        elif command == "level 1": # or result == "level 2 left":
             print("LEFT1")
             turn(states.Dir.LEFT)
             time.sleep(2)
 
-        elif "level 2" in result:
+        elif command == "level 2":
             print("LEFT2")
             turn(states.Dir.LEFT)
             time.sleep(2)
 
-        elif result != 0:
+        else:
             go_forward()
             time.sleep(1)
-            line_is = analyse_sensor(get_threaded_sensor_states())
+            line_is = analyse_sensor(sensor_check())
             if line_is == states.SENSORSTATE.WHITE:
                 racing = False
                 active = False
                 print("Goal Reached.")
             
+        # Only codes seen on the way to the next crossing count for it
+        pending_qr = None
+        qr_scanner.resume_worker()
 
         time.sleep(update_time)
 
-    # Clean up threads and resources
-    sensor_thread_running = False
-    print("Stopping sensor monitoring thread...")
-    sensor_thread.join(timeout=1.0)  # Wait up to 1 second for thread to finish
+    # Clean up resources
     qr_scanner.cleanup() # clean up camera
     print("Program terminated successfully.")
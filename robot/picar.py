@@ -8,8 +8,35 @@ import busio
 from adafruit_pca9685 import PCA9685
 from adafruit_servokit import ServoKit
 import atexit
+import mmap
+from array import array
+import os
+import select
+import time
 from typing import List, Optional
 
+try:
+    import gpiod
+except ImportError:
+    gpiod = None
+
+# BCM283x GPIO register offsets within the /dev/gpiomem mapping
+GPCLR0 = 0x28  # Output clear register for GPIO 0-31
+GPLEV0 = 0x34  # Pin level register for GPIO 0-31
+
+# PCA9685 registers
+PCA9685_LED0_ON_L = 0x06  # Each channel has 4 registers: ON_L, ON_H, OFF_L, OFF_H
+PCA9685_ALL_LED_OFF_H = 0xFD
+PCA9685_FULL_OFF = 0x1000  # Full-off bit in the OFF count
+
+
+def _speed_to_off_count(speed: float) -> int:
+    # Same scaling as set_speed, converted to the 12-bit OFF count the way
+    # adafruit_pca9685 does for duty_cycle
+    duty = int(max(min(1.0, speed), 0) * 0x7fff)
+    return duty >> 4 if duty >= 0x10 else PCA9685_FULL_OFF
+
+
 class Picar:
     def __init__(self):
         # Initialize I2C bus
@@ -24,10 +51,22 @@ class Picar:
         self.left_dir_b = DigitalOutputDevice(24)  # Left motor direction pin 
         self.right_dir_a = DigitalOutputDevice(27) # Right motor direction pin
         self.right_dir_b = DigitalOutputDevice(22) # Right motor direction pin
+        self._direction_pin_mask = (1 << 23) | (1 << 24) | (1 << 27) | (1 << 22)
 
         self.ENA = 1  # Left motor speed PCA9685 port 1
         self.ENB = 0  # Right motor speed PCA9685 port 0
 
+        # Register block covering both (adjacent) motor channels, written in a
+        # single I2C transaction by set_speeds. Layout: start register, then
+        # ON_L, ON_H, OFF_L, OFF_H per channel. ON stays 0.
+        first_channel = min(self.ENA, self.ENB)
+        self._speed_regs = bytearray(9)
+        self._speed_regs[0] = PCA9685_LED0_ON_L + 4 * first_channel
+        self._left_off_idx = 3 + 4 * (self.ENA - first_channel)
+        self._right_off_idx = 3 + 4 * (self.ENB - first_channel)
+        # OFF counts for the 256 quantized speed levels used by set_speeds_q
+        self._off_counts = array('H', [_speed_to_off_count(i / 255) for i in range(256)])
+
         self.sensors = [
             DigitalInputDevice(5, pull_up=True),  # No.1 sensor from far left
             DigitalInputDevice(6, pull_up=True),  # No.2 sensor from left
@@ -35,12 +74,52 @@ class Picar:
             DigitalInputDevice(19, pull_up=True), # No.2 sensor from right
             DigitalInputDevice(26, pull_up=True), # No.1 sensor from far right
         ]
+        self.sensor_pins = (5, 6, 13, 19, 26)
         self.servo = 15 # camera servo
 
+        # Map the GPIO registers so all line sensors are read with one load
+        # instead of five pigpio round trips. gpiozero still sets the pull-ups.
+        self._gpio_regs = None
+        try:
+            fd = os.open('/dev/gpiomem', os.O_RDWR | os.O_SYNC)
+            try:
+                self._gpio_mem = mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+            self._gpio_regs = memoryview(self._gpio_mem).cast('I')
+        except OSError as e:
+            print(f"GPIO register access unavailable ({e}), using gpiozero for sensors")
+
+        # Request edge events on the sensor lines so the control loop can sleep
+        # until a sensor changes instead of waking on a fixed period
+        self.sensor_event_fds: List[int] = []
+        self._sensor_event_lines = {}
+        self._sensor_epoll = None
+        if gpiod is not None:
+            try:
+                chip = gpiod.Chip('gpiochip0')
+                lines = chip.get_lines(list(self.sensor_pins))
+                lines.request(consumer='picar', type=gpiod.LINE_REQ_EV_BOTH_EDGES)
+                self._sensor_epoll = select.epoll()
+                for line in lines:
+                    fd = line.event_get_fd()
+                    self._sensor_event_lines[fd] = line
+                    self.sensor_event_fds.append(fd)
+                    self._sensor_epoll.register(fd, select.EPOLLIN | select.EPOLLPRI)
+            except (OSError, AttributeError) as e:
+                # gpiod 2.x renamed this API, e.g. Chip needs a /dev path and lines are requested with request_lines
+                print(f"Sensor edge events unavailable ({e}), libgpiod v1 Python bindings are required; "
+                      "falling back to polling")
+                if self._sensor_epoll is not None:
+                    self._sensor_epoll.close()
+                self._sensor_epoll = None
+                self._sensor_event_lines = {}
+                self.sensor_event_fds = []
+
         self.MOTOR_LEFT = 0
         self.MOTOR_RIGHT = 1
 
-        # Adjust for 25Hz
+        # Adjust for 25Hz (this also enables register auto-increment)
         self.pwm.frequency = 25
         self.servokit.servo[self.servo].set_pulse_width_range(min_pulse=650, max_pulse=2500)
 
@@ -51,9 +130,16 @@ class Picar:
 
     def exit(self) -> None:
         print("Cleanup!")
-        self.set_camera_angle(None)
-        self.set_speed(self.MOTOR_LEFT, 0)
-        self.set_speed(self.MOTOR_RIGHT, 0)
+        # Setting the full-off bit in ALL_LED_OFF_H turns off every PWM channel
+        # at once, which stops both motors and releases the camera servo
+        with self.pwm.i2c_device as i2c:
+            i2c.write(bytes((PCA9685_ALL_LED_OFF_H, PCA9685_FULL_OFF >> 8)))
+        # Drive all motor direction pins low with a single register write
+        if self._gpio_regs is not None:
+            self._gpio_regs[GPCLR0 >> 2] = self._direction_pin_mask
+        else:
+            for pin in (self.left_dir_a, self.left_dir_b, self.right_dir_a, self.right_dir_b):
+                pin.off()
 
     def set_speed(self, motor_idx: int, speed: float) -> None:
         speed = max(min(1.0, speed), 0)
@@ -63,6 +149,23 @@ class Picar:
         elif motor_idx == self.MOTOR_RIGHT:
             self.pwm.channels[self.ENB].duty_cycle = duty
 
+    def set_speeds(self, left: float, right: float) -> None:
+        # Set both motors with a single I2C transaction
+        self._write_off_counts(_speed_to_off_count(left), _speed_to_off_count(right))
+
+    def set_speeds_q(self, left_q8: int, right_q8: int) -> None:
+        # Like set_speeds, with speeds quantized to 0..255 (255 = full speed)
+        self._write_off_counts(self._off_counts[left_q8], self._off_counts[right_q8])
+
+    def _write_off_counts(self, left_off: int, right_off: int) -> None:
+        regs = self._speed_regs
+        regs[self._left_off_idx] = left_off & 0xFF
+        regs[self._left_off_idx + 1] = left_off >> 8
+        regs[self._right_off_idx] = right_off & 0xFF
+        regs[self._right_off_idx + 1] = right_off >> 8
+        with self.pwm.i2c_device as i2c:
+            i2c.write(regs)
+
     def set_motor_direction(self, motor_idx: int, forward: bool) -> None:
         if motor_idx == self.MOTOR_LEFT:
             if forward:
@@ -88,8 +191,30 @@ class Picar:
             self.right_dir_a.off()
             self.right_dir_b.off()
 
-    def get_line_sensor_states(self) -> List[bool]:
-        return [s.value for s in self.sensors]
+    def get_line_sensor_states(self) -> int:
+        # Returns a 5-bit mask, bit i set when sensor i (0 = far left) is active
+        if self._gpio_regs is None:
+            mask = 0
+            for i, s in enumerate(self.sensors):
+                if s.value:
+                    mask |= 1 << i
+            return mask
+        # Sensors are pulled up (active low), so invert the pin levels
+        level = ~self._gpio_regs[GPLEV0 >> 2]
+        # GPIO 5, 6, 13, 19, 26 -> bits 0..4
+        return (((level >> 5) & 0x03) | ((level >> 11) & 0x04) |
+                ((level >> 16) & 0x08) | ((level >> 22) & 0x10))
+
+    def wait_for_line_sensor_change(self, timeout: float) -> bool:
+        # Sleep until a sensor edge or the timeout, returns True on an edge
+        if self._sensor_epoll is None:
+            time.sleep(timeout)
+            return False
+        events = self._sensor_epoll.poll(timeout)
+        for fd, _ in events:
+            # Drain queued edges, the current levels are read from GPLEV0
+            self._sensor_event_lines[fd].event_read_multiple()
+        return bool(events)
 
     def set_camera_angle(self, angle: Optional[int]) -> None:
         if angle is not None:
@@ -1,14 +1,61 @@
 import cv2
+import numpy as np
+import os
+import threading
 import time
 import logging
-from pyzbar import pyzbar
 from picar import Picar
+from zbarscanner import ZBarScanner
+
+try:
+    from picamera2 import Picamera2, MappedArray
+except ImportError:
+    Picamera2 = None
+
+# Capture size; with the YUV420 format the first FRAME_HEIGHT rows are the Y plane
+FRAME_WIDTH, FRAME_HEIGHT = 640, 480
+
+# Servo settle time: SERVO_SETTLE_PER_DEG seconds per degree moved, at least SERVO_SETTLE_MIN
+SERVO_SETTLE_PER_DEG = 0.3 / 180
+SERVO_SETTLE_MIN = 0.05
+
+# How long start_scan waits for the background worker before sweeping the camera
+WORKER_WAIT = 0.5
+
+# Nice value of the background worker, so decoding yields to the driving loop
+WORKER_NICE = 5
+
+# The worker only decodes when a FINGERPRINT_SIZE^2 thumbnail, reduced to 16 gray
+# levels, differs from the previous frame's
+FINGERPRINT_SIZE = 16
+
+# ZBar scans every ZBAR_DENSITY-th row and column, 2 halves the work on high contrast codes
+ZBAR_DENSITY = 2
+
+
+def _performance_cores():
+    """
+    CPUs with the highest cpu_capacity among those this process may use.
+    On big.LITTLE SoCs these are the big cores; when the kernel does not
+    report capacities (e.g. all cores are equal) every allowed CPU is returned.
+    """
+    allowed = os.sched_getaffinity(0)
+    capacities = {}
+    for cpu in allowed:
+        try:
+            with open(f'/sys/devices/system/cpu/cpu{cpu}/cpu_capacity') as f:
+                capacities[cpu] = int(f.read())
+        except (OSError, ValueError):
+            return allowed
+    best = max(capacities.values())
+    return {cpu for cpu, capacity in capacities.items() if capacity == best}
 
 
 class QRCamera:
     """
     A class for QR code scanning using a servo-controlled camera.
-    Rotates the camera left, center, right to scan for QR codes.
+    Rotates the camera left, center, right to scan for QR codes, and can
+    decode frames in a background thread while the car is driving.
     """
     
     def __init__(self, picar_instance=None, offset=-20):
@@ -20,9 +67,37 @@ class QRCamera:
             offset (int): Servo calibration offset in degrees
         """
         self.offset = offset
+        self._center = 0 + offset
+        self._scan_positions = (-45 + offset, 0 + offset, 45 + offset)  # Left 45°, Center, Right 45°
         self.camera_instance = None
+        self._capture_gray = self._capture_gray_opencv  # Set by _init_camera for the chosen backend
         self.picar_instance = picar_instance
         self.owns_picar = picar_instance is None  # Track if we created the picar instance
+        self._last_angle = None  # Last commanded camera angle, None if unknown
+        self._settle_deadline = 0.0  # time.monotonic() when the last servo move has settled
+        self._last_roi = {}  # Angle -> (x, y, w, h) of the last QR code decoded there
+        try:
+            # libzbar scanner and image configured once, only the pixels change per scan
+            self._scanner = ZBarScanner(density=ZBAR_DENSITY)
+        except OSError:
+            self._scanner = None
+        # OpenCV's detector when libzbar is missing, one instance is reused
+        self._qr_detector = cv2.QRCodeDetector() if hasattr(cv2, 'QRCodeDetector') else None
+        
+        # Frame buffers reused by every scan instead of allocating per capture
+        self._gray_buf = np.empty((FRAME_HEIGHT, FRAME_WIDTH), np.uint8)
+        self._small_buf = np.empty((FRAME_HEIGHT // 2, FRAME_WIDTH // 2), np.uint8)
+        self._bin_buf = np.empty((FRAME_HEIGHT, FRAME_WIDTH), np.uint8)
+        self._bgr_buf = None  # OpenCV fallback frame, allocated by the first read and reused
+        
+        # Background decoding while driving, see start_worker
+        self._camera_lock = threading.Lock()  # Serializes capture and decode on the shared buffers
+        self._latest = None  # One-slot result handoff to the controller
+        self._qr_event = threading.Event()
+        self._worker_active = threading.Event()  # Cleared while the worker is paused
+        self._worker = None
+        self._worker_running = False
+        self._thumb_buf = np.empty((FINGERPRINT_SIZE, FINGERPRINT_SIZE), np.uint8)
         
         # Initialize components
         if self.picar_instance is None:
@@ -42,68 +117,353 @@ class QRCamera:
     
     def _init_camera(self):
         """Initialize camera (Picamera2 or OpenCV fallback)"""
+        if Picamera2 is None:
+            logging.error("Picamera2 not available, using OpenCV camera")
+            self.camera_instance = self._open_video_capture()
+            return
         try:
-            from picamera2 import Picamera2
             picam2 = Picamera2()
-            config = picam2.create_video_configuration(main={"size": (640, 480)})
+            # YUV420 so the luma plane can go to zbar without a color conversion
+            config = picam2.create_video_configuration(
+                main={"size": (FRAME_WIDTH, FRAME_HEIGHT), "format": "YUV420"})
             picam2.configure(config)
             picam2.start()
             self.camera_instance = picam2
+            self._capture_gray = self._capture_gray_picamera2
             logging.info("Picamera2 initialized successfully")
-        except ImportError:
-            logging.error("Picamera2 not available, using OpenCV camera")
-            self.camera_instance = cv2.VideoCapture(0)
         except Exception as e:
             logging.error(f"Error initializing Picamera2: {e}, falling back to OpenCV")
-            self.camera_instance = cv2.VideoCapture(0)
+            self.camera_instance = self._open_video_capture()
+    
+    def _open_video_capture(self):
+        """Open the OpenCV fallback camera at the frame size the scan buffers expect"""
+        capture = cv2.VideoCapture(0)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+        return capture
+    
+    def _capture_gray_picamera2(self):
+        """
+        Capture one grayscale frame from Picamera2.
+        
+        Returns:
+            numpy.ndarray: FRAME_HEIGHT x FRAME_WIDTH grayscale frame
+        """
+        # The Y plane of the YUV420 buffer is already grayscale. It is copied
+        # straight out of the mapped camera buffer, which goes back to the
+        # camera right after, instead of capture_array allocating a new frame.
+        request = self.camera_instance.capture_request()
+        try:
+            with MappedArray(request, "main") as mapped:
+                np.copyto(self._gray_buf, mapped.array[:FRAME_HEIGHT, :FRAME_WIDTH])
+        finally:
+            request.release()
+        return self._gray_buf
     
-    def _scan_for_qr_at_position(self, angle):
+    def _capture_gray_opencv(self):
+        """
+        Capture one grayscale frame from OpenCV VideoCapture.
+        
+        Returns:
+            numpy.ndarray or None: FRAME_HEIGHT x FRAME_WIDTH grayscale frame, None on failure
+        """
+        # OpenCV VideoCapture delivers BGR, read into the previous frame's buffer
+        ret, frame = self.camera_instance.read(self._bgr_buf)
+        if not ret or frame is None:
+            return None
+        self._bgr_buf = frame
+        if frame.shape[:2] != self._gray_buf.shape:
+            # The camera ignored the requested size, scale to the size the scan buffers expect
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            return cv2.resize(gray, (FRAME_WIDTH, FRAME_HEIGHT), dst=self._gray_buf,
+                              interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray_buf)
+    
+    def _start_move(self, angle):
+        """
+        Command the camera servo to a new angle without waiting for it.
+        
+        The settle time grows with the angle moved; _finish_move waits out
+        whatever is left of it.
+        
+        Args:
+            angle (int): Camera angle in degrees
+        """
+        self.picar_instance.set_camera_angle(angle)
+        
+        if self._last_angle is None:
+            settle = 180 * SERVO_SETTLE_PER_DEG  # Unknown start, allow a full sweep
+        else:
+            settle = max(SERVO_SETTLE_MIN, abs(angle - self._last_angle) * SERVO_SETTLE_PER_DEG)
+        self._last_angle = angle
+        self._settle_deadline = time.monotonic() + settle
+    
+    def _finish_move(self):
+        """
+        Wait until the last commanded servo move has settled.
+        
+        A throwaway frame is grabbed first, which flushes a frame taken while
+        the servo was moving and lets auto-exposure catch up, and only the
+        remaining settle time is slept.
+        """
+        self._capture_gray()
+        remaining = self._settle_deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def _scan_for_qr_at_position(self, angle, full_res=False, next_angle=None, scanned=None):
         """
         Scan for QR code at a specific camera angle.
         
         Args:
             angle (int): Camera angle in degrees
+            full_res (bool): Retry at full resolution if the downscaled frame has no QR code
+            next_angle (int): Angle of the following scan, if any. The servo starts
+                moving there before this frame is decoded, so the move overlaps decoding.
+            scanned (dict): Angle -> (fingerprint, full_res) of the previous scan there,
+                updated with this scan. An unchanged view that was already decoded at
+                full resolution is skipped, one only seen downscaled gets the full pass.
             
         Returns:
             str or None: QR code data if found, None otherwise
         """
-        if self.picar_instance:
-            self.picar_instance.set_camera_angle(angle)
-            time.sleep(0.5)  # Wait for servo to move
-        
-        # Capture a frame for QR scanning
-        if hasattr(self.camera_instance, 'capture_array'):
-            # Picamera2
-            frame = self.camera_instance.capture_array()
-        else:
-            # OpenCV VideoCapture
-            ret, frame = self.camera_instance.read()
-            if not ret:
+        with self._camera_lock:
+            if self.picar_instance:
+                if angle != self._last_angle:
+                    self._start_move(angle)
+                self._finish_move()
+            
+            # Capture a grayscale frame for QR scanning
+            gray = self._capture_gray()
+            if gray is None:
                 return None
+            
+            if self.picar_instance and next_angle is not None:
+                self._start_move(next_angle)
+            
+            if scanned is not None:
+                fingerprint = self._fingerprint(gray)
+                previous = scanned.get(angle)
+                if previous is not None and previous[0] == fingerprint:
+                    if previous[1]:
+                        scanned[angle] = previous
+                        return None
+                    full_res = True
+                scanned[angle] = (fingerprint, full_res)
+            
+            # Codes reappear where they were last seen, try that region before the whole frame
+            qr_data = self._scan_last_roi(gray, angle)
+            if qr_data is None:
+                qr_data, rect = self._decode(gray, full_res)
+                if rect is not None:
+                    self._last_roi[angle] = rect
+        
+        if qr_data:
+            logging.info("QR code detected at angle %s°: %s", angle, qr_data)
+        return qr_data
+    
+    def _scan_last_roi(self, gray, angle):
+        """
+        Scan the region around the last QR code decoded at this angle,
+        expanded by half its size on every side.
         
-        if frame is None:
+        Args:
+            gray (numpy.ndarray): Full size grayscale frame
+            angle (int): Camera angle the frame was taken at
+            
+        Returns:
+            str or None: QR code data if found, None otherwise
+        """
+        roi = self._last_roi.get(angle)
+        if roi is None:
             return None
+        x, y, w, h = roi
+        left, top = max(0, x - w // 2), max(0, y - h // 2)
+        crop = gray[top:y + 3 * h // 2, left:x + 3 * w // 2]
+        if crop.size == 0:
+            return None
+        qr_data, rect = self._scan(crop)
+        if rect is not None:
+            # Track the code as it drifts within the frame
+            self._last_roi[angle] = (rect[0] + left, rect[1] + top, rect[2], rect[3])
+        return qr_data
+    
+    def _decode(self, gray, full_res=False):
+        """
+        Decode the first QR code in a grayscale frame.
         
-        # Convert to grayscale for QR detection
-        if len(frame.shape) == 3:
-            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY if hasattr(self.camera_instance, 'capture_array') else cv2.COLOR_BGR2GRAY)
-        else:
-            gray = frame
+        Args:
+            gray (numpy.ndarray): Grayscale frame
+            full_res (bool): Retry at full resolution if the downscaled frame has no QR code
             
-        # Detect QR codes
-        qr_codes = pyzbar.decode(gray)
+        Returns:
+            tuple: (data, rect) of the QR code, rect being its (x, y, w, h) in
+                full size frame pixels, or (None, None) if none was found
+        """
+        # Detect QR codes on a half-size frame, decode time scales with pixel count
+        qr_data, rect = self._scan(cv2.pyrDown(gray, dst=self._small_buf))
+        if rect is not None:
+            rect = tuple(2 * v for v in rect)
+        if qr_data is None and full_res:
+            qr_data, rect = self._scan(gray)
+            if qr_data is None:
+                # Last resort for low contrast codes
+                qr_data, rect = self._scan(self._binarize(gray))
+        return qr_data, rect
+    
+    def _binarize(self, gray):
+        """
+        Otsu-threshold a full size grayscale frame into the reused binary buffer.
+        
+        Args:
+            gray (numpy.ndarray): FRAME_HEIGHT x FRAME_WIDTH grayscale frame
+            
+        Returns:
+            numpy.ndarray: Binary frame with values 0 and 255
+        """
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=self._bin_buf)
+        return self._bin_buf
+    
+    def _scan(self, gray):
+        """
+        Decode one grayscale image with libzbar if installed, else OpenCV's
+        QRCodeDetector.
+        
+        Args:
+            gray (numpy.ndarray): Grayscale image
+            
+        Returns:
+            tuple: (data, rect) of the first QR code found, rect being its
+                (x, y, w, h) bounding box, or (None, None) if none was found
+        """
+        if self._scanner is not None:
+            return self._scanner.scan(gray)
+        
+        if self._qr_detector is not None:
+            data, points, _ = self._qr_detector.detectAndDecode(gray)
+            if data:
+                rect = cv2.boundingRect(points.reshape(-1, 2).astype(np.int32)) if points is not None else None
+                return data, rect
+        
+        return None, None
+    
+    def _fingerprint(self, gray):
+        """
+        Hash a coarse thumbnail of a frame, so sensor noise on a static scene
+        gives the same value.
+        
+        Args:
+            gray (numpy.ndarray): Grayscale frame
+            
+        Returns:
+            int: Fingerprint of the frame
+        """
+        thumb = cv2.resize(gray, (FINGERPRINT_SIZE, FINGERPRINT_SIZE),
+                           dst=self._thumb_buf, interpolation=cv2.INTER_AREA)
+        np.right_shift(thumb, 4, out=thumb)
+        return hash(thumb.tobytes())
+    
+    def _worker_loop(self):
+        """Decode the newest camera frame continuously and publish any QR code found"""
+        # Keep decoding on the fastest cores, behind the driving loop. Both calls
+        # only affect this thread on Linux.
+        try:
+            os.sched_setaffinity(0, _performance_cores())
+            os.setpriority(os.PRIO_PROCESS, 0, WORKER_NICE)
+        except OSError as e:
+            logging.warning(f"Could not set QR worker CPU placement: {e}")
+        
+        last_fingerprint = None
+        while self._worker_running:
+            self._worker_active.wait()
+            try:
+                with self._camera_lock:
+                    if not self._worker_active.is_set():
+                        continue  # Paused while waiting for the camera
+                    gray = self._capture_gray()
+                    # Skip decoding when the scene has not changed
+                    fingerprint = self._fingerprint(gray) if gray is not None else None
+                    if fingerprint is None or fingerprint == last_fingerprint:
+                        qr_data = None
+                    else:
+                        last_fingerprint = fingerprint
+                        qr_data, _ = self._decode(gray)
+                    if qr_data:
+                        # Published under the lock, so pause_worker() can drop it
+                        self._latest = qr_data
+                        self._qr_event.set()
+                        # Keep decoding after a hit so a newly visible code replaces it
+                        last_fingerprint = None
+                if gray is None:
+                    time.sleep(0.1)  # Camera not delivering frames
+            except Exception as e:
+                logging.error(f"QR worker error: {e}")
+                time.sleep(0.1)
+    
+    def start_worker(self):
+        """
+        Start decoding frames in a background thread while the car drives.
         
-        if qr_codes:
-            # Get the first QR code found
-            qr_data = qr_codes[0].data.decode('utf-8')
-            logging.info(f"QR code detected at angle {angle}°: {qr_data}")
-            return qr_data
+        Results are picked up with latest_result(), and start_scan() first
+        waits briefly for one before falling back to the servo sweep.
+        """
+        if self._worker is not None or not self.camera_instance:
+            return
+        self._worker_running = True
+        self._worker_active.set()
+        self._worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self._worker.start()
+        logging.info("QR worker started")
+    
+    def stop_worker(self):
+        """Stop the background decoding thread"""
+        if self._worker is None:
+            return
+        self._worker_running = False
+        self._worker_active.set()  # Wake a paused worker so it can exit
+        self._worker.join(timeout=1.0)
+        self._worker = None
+        logging.info("QR worker stopped")
+    
+    def pause_worker(self):
+        """
+        Stop background decoding and drop any result not yet taken.
+        Returns once the worker has released the camera.
+        """
+        self._worker_active.clear()
+        with self._camera_lock:
+            self._latest = None
+            self._qr_event.clear()
+    
+    def resume_worker(self):
+        """Continue background decoding, dropping any result from before the pause"""
+        if self._worker is None:
+            return
+        with self._camera_lock:
+            self._latest = None
+            self._qr_event.clear()
+        self._worker_active.set()
+    
+    def latest_result(self):
+        """
+        Take the most recent QR code decoded by the background worker.
         
-        return None
+        Returns:
+            str or None: QR code data, or None if nothing new was decoded
+        """
+        qr_data = self._latest
+        if qr_data is not None:
+            self._latest = None
+            self._qr_event.clear()
+        return qr_data
     
     def start_scan(self):
         """
         Perform the complete scanning sequence: left -> center -> right, up to 3 cycles.
+        The camera is left where the scan ended, call recenter() if it has to face forward.
+        A running background worker gets WORKER_WAIT to report a code first and
+        is paused during the sweep, so it neither competes for the camera nor
+        decodes frames taken at the sweep angles.
         
         Returns:
             str: QR code data if found, or "no qr code detected" if not found
@@ -111,39 +471,81 @@ class QRCamera:
         if not self.camera_instance:
             logging.error('Camera not available')
             return "no qr code detected"
-
-        scan_positions = [-45 + self.offset, 0 + self.offset, 45 + self.offset]  # Left 45°, Center, Right 45°
+        
+        worker_active = self._worker is not None and self._worker_active.is_set()
+        # The background worker may already have the code in view
+        if worker_active and self._qr_event.wait(WORKER_WAIT):
+            qr_data = self.latest_result()
+            if qr_data:
+                logging.info(f"QR code scan complete: {qr_data}")
+                return qr_data
+        
+        if worker_active:
+            self.pause_worker()
+        try:
+            return self._sweep()
+        finally:
+            if worker_active:
+                self.resume_worker()
+    
+    def _sweep(self):
+        """
+        Scan left -> center -> right with the servo, up to 3 cycles.
+        
+        Returns:
+            str: QR code data if found, or "no qr code detected" if not found
+        """
         max_cycles = 3
+        scanned = {}  # Angle -> (fingerprint, full_res) of the last scan there
         
         for cycle in range(max_cycles):
-            logging.info(f"Starting scan cycle {cycle + 1}/{max_cycles}")
+            # Stop once a whole cycle saw the same views as the one before and all of
+            # them were decoded at full resolution, further cycles cannot find more
+            if cycle > 1 and all(scanned.get(angle, (None, False))[1] and
+                                 previous.get(angle, (None,))[0] == scanned[angle][0]
+                                 for angle in self._scan_positions):
+                logging.info("Scene unchanged, ending scan after %d cycles", cycle)
+                break
+            previous = dict(scanned)
+            
+            # Lazy %-style arguments, the messages are only built when INFO is enabled
+            logging.info("Starting scan cycle %d/%d", cycle + 1, max_cycles)
             
-            for angle in scan_positions:
-                logging.info(f"Scanning at {angle}° (cycle {cycle + 1})")
-                qr_data = self._scan_for_qr_at_position(angle)
+            for i, angle in enumerate(self._scan_positions):
+                logging.info("Scanning at %s° (cycle %d)", angle, cycle + 1)
+                # The servo heads for the next position while this frame is decoded
+                if i + 1 < len(self._scan_positions):
+                    next_angle = self._scan_positions[i + 1]
+                elif cycle + 1 < max_cycles:
+                    next_angle = self._scan_positions[0]
+                else:
+                    next_angle = None
+                # Small or distant codes get a full resolution pass on the last cycle
+                qr_data = self._scan_for_qr_at_position(
+                    angle, full_res=cycle == max_cycles - 1, next_angle=next_angle, scanned=scanned)
                 
                 if qr_data:
-                    # QR code found, return camera to center position and return data
-                    if self.picar_instance:
-                        self.picar_instance.set_camera_angle(0 + self.offset)
-                    
                     logging.info(f"QR code scan complete: {qr_data}")
                     return qr_data
-            
-            # Small delay between cycles
-            time.sleep(0.1)
         
         # No QR code found after all cycles
-        logging.warning("No QR code detected after 3 complete scan cycles")
-        
-        # Return camera to center position
-        if self.picar_instance:
-            self.picar_instance.set_camera_angle(0 + self.offset)
+        logging.warning("No QR code detected after scanning all positions")
         
         return "no qr code detected"
     
+    def recenter(self):
+        """Turn the camera back to the center position"""
+        if self.picar_instance:
+            self.picar_instance.set_camera_angle(self._center)
+            self._last_angle = self._center
+    
     def cleanup(self):
         """Clean up camera and PiCar resources"""
+        self.stop_worker()
+        if self._scanner is not None:
+            self._scanner.close()
+            self._scanner = None
+        
         # Cleanup camera
         if self.camera_instance is not None:
             try:
@@ -154,9 +556,6 @@ class QRCamera:
                     self.camera_instance.release()
                     logging.info("Camera released")
                 
-                # Give camera time to fully release
-                time.sleep(0.5)
-                
             except Exception as e:
                 logging.error(f"Error cleaning up camera: {e}")
             finally:
@@ -169,9 +568,6 @@ class QRCamera:
                 self.picar_instance.exit()
                 logging.info("PiCar cleaned up")
                 
-                # Give GPIO pins time to fully release
-                time.sleep(0.5)
-                
             except Exception as e:
                 logging.error(f"Error cleaning up PiCar: {e}")
             finally:
@@ -185,10 +581,6 @@ class QRCamera:
                 logging.error(f"Error returning camera to center: {e}")
         
         logging.info("Cleanup!")
-        
-        # Force garbage collection to help release resources
-        import gc
-        gc.collect()
     
     def __enter__(self):
         """Context manager entry"""
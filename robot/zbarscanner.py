@@ -0,0 +1,128 @@
+import ctypes
+import ctypes.util
+import numpy as np
+
+# Constants from zbar.h
+ZBAR_NONE = 0
+ZBAR_QRCODE = 64
+ZBAR_CFG_ENABLE = 0
+ZBAR_CFG_X_DENSITY = 0x100
+ZBAR_CFG_Y_DENSITY = 0x101
+
+# 8-bit grayscale image format
+FOURCC_Y800 = ord('Y') | ord('8') << 8 | ord('0') << 16 | ord('0') << 24
+
+
+def _load_libzbar():
+    """Load libzbar and declare the functions used, or return None if it is not installed"""
+    path = ctypes.util.find_library('zbar') or 'libzbar.so.0'
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+
+    lib.zbar_image_scanner_create.restype = ctypes.c_void_p
+    lib.zbar_image_scanner_set_config.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    lib.zbar_image_scanner_destroy.argtypes = [ctypes.c_void_p]
+    lib.zbar_image_create.restype = ctypes.c_void_p
+    lib.zbar_image_destroy.argtypes = [ctypes.c_void_p]
+    lib.zbar_image_set_format.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    lib.zbar_image_set_size.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
+    lib.zbar_image_set_data.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong, ctypes.c_void_p]
+    lib.zbar_scan_image.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+    lib.zbar_image_first_symbol.argtypes = [ctypes.c_void_p]
+    lib.zbar_image_first_symbol.restype = ctypes.c_void_p
+    lib.zbar_symbol_get_data.argtypes = [ctypes.c_void_p]
+    lib.zbar_symbol_get_data.restype = ctypes.c_void_p
+    lib.zbar_symbol_get_data_length.argtypes = [ctypes.c_void_p]
+    lib.zbar_symbol_get_data_length.restype = ctypes.c_uint
+    lib.zbar_symbol_get_loc_size.argtypes = [ctypes.c_void_p]
+    lib.zbar_symbol_get_loc_size.restype = ctypes.c_uint
+    lib.zbar_symbol_get_loc_x.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+    lib.zbar_symbol_get_loc_y.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+    return lib
+
+
+_libzbar = _load_libzbar()
+
+
+class ZBarScanner:
+    """
+    QR decoder calling libzbar directly.
+    The scanner and image objects are created and configured once and reused
+    for every frame; only the image size and data pointer change per scan.
+    """
+
+    def __init__(self, density=1):
+        """
+        Create and configure the scanner.
+
+        Args:
+            density (int): Scan every density-th row and column
+
+        Raises:
+            OSError: If libzbar is not installed or rejects the configuration
+        """
+        if _libzbar is None:
+            raise OSError("libzbar not found")
+        self._lib = _libzbar
+
+        self._image = None
+        self._scanner = self._lib.zbar_image_scanner_create()
+        # Only QR codes, the other symbologies are never tried. Density is an
+        # image scanner setting, it only takes effect with ZBAR_NONE
+        for symbology, config, value in ((ZBAR_NONE, ZBAR_CFG_ENABLE, 0),
+                                         (ZBAR_QRCODE, ZBAR_CFG_ENABLE, 1),
+                                         (ZBAR_NONE, ZBAR_CFG_X_DENSITY, density),
+                                         (ZBAR_NONE, ZBAR_CFG_Y_DENSITY, density)):
+            if self._lib.zbar_image_scanner_set_config(self._scanner, symbology, config, value) != 0:
+                self.close()
+                raise OSError(f"libzbar rejected config {config:#x}={value} for symbology {symbology}")
+
+        self._image = self._lib.zbar_image_create()
+        self._lib.zbar_image_set_format(self._image, FOURCC_Y800)
+
+    def scan(self, gray):
+        """
+        Decode the first QR code in a grayscale image.
+
+        Args:
+            gray (numpy.ndarray): 2D uint8 image
+
+        Returns:
+            tuple: (data, rect) of the QR code, rect being its (x, y, w, h)
+                bounding box in pixels, or (None, None) if none was found
+        """
+        gray = np.ascontiguousarray(gray)  # No copy for the contiguous scan buffers
+        height, width = gray.shape
+        self._lib.zbar_image_set_size(self._image, width, height)
+        # ZBar only borrows the pixels, gray stays referenced until the scan returns
+        self._lib.zbar_image_set_data(self._image, gray.ctypes.data, gray.nbytes, None)
+
+        if self._lib.zbar_scan_image(self._scanner, self._image) <= 0:
+            return None, None
+        symbol = self._lib.zbar_image_first_symbol(self._image)
+        if not symbol:
+            return None, None
+        data = ctypes.string_at(self._lib.zbar_symbol_get_data(symbol),
+                                self._lib.zbar_symbol_get_data_length(symbol))
+        return data.decode('utf-8'), self._bounding_rect(symbol)
+
+    def _bounding_rect(self, symbol):
+        """Bounding box (x, y, w, h) of a symbol's location polygon"""
+        count = self._lib.zbar_symbol_get_loc_size(symbol)
+        if count == 0:
+            return None
+        xs = [self._lib.zbar_symbol_get_loc_x(symbol, i) for i in range(count)]
+        ys = [self._lib.zbar_symbol_get_loc_y(symbol, i) for i in range(count)]
+        return min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1
+
+    def close(self):
+        """Free the libzbar scanner and image"""
+        if self._image:
+            self._lib.zbar_image_set_data(self._image, None, 0, None)
+            self._lib.zbar_image_destroy(self._image)
+            self._image = None
+        if self._scanner:
+            self._lib.zbar_image_scanner_destroy(self._scanner)
+            self._scanner = None